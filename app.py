@@ -1,16 +1,79 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import re
+import sys
+import csv
+import io
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import quote, unquote
 
 # --- 기본 설정 및 데이터 로딩 ---
 
 st.set_page_config(page_title="GNU 시간표 도우미", layout="wide")
-st.title("👨‍💻 경상국립대학교 2025학년도 2학기 시간표 도우미")
+
+# --- 학기별 시간표 카탈로그 ---
+# app.py와 같은 폴더에 '... 2025학년도 2학기 시간표.xlsx' 형식으로 파일을 넣으면 학기가 자동으로 등록된다.
+CATALOG_DIR = os.path.dirname(os.path.abspath(__file__))
+TERM_FILE_PATTERN = re.compile(r'(\d{4})학년도 (\d)학기 시간표\.xlsx$')
+REPO_RAW_URL = "https://github.com/youngchaurachacha/gnu-timetable/raw/refs/heads/main/"
+# term 파라미터가 도입되기 전에 공유된 링크(courses만 있음)는 모두 이 학기의 과목을 가리킨다.
+LEGACY_TERM = "2025-2"
+# 메모리에 동시에 올려둘 최대 학기 수. 초과하면 가장 오래 사용하지 않은 학기부터 캐시에서 제거된다.
+MAX_CACHED_TERMS = 3
+
+def discover_terms(catalog_dir):
+    """폴더에서 학기별 시간표 엑셀 파일을 찾아 {'2025-2': 파일 경로} 형태로 최신 학기부터 반환한다."""
+    terms = {}
+    for file_name in os.listdir(catalog_dir):
+        match = TERM_FILE_PATTERN.search(file_name)
+        if match:
+            terms[f"{match.group(1)}-{match.group(2)}"] = os.path.join(catalog_dir, file_name)
+    return dict(sorted(terms.items(), reverse=True))
+
+def format_term(term):
+    """'2025-2' 형태의 학기 키를 '2025학년도 2학기'로 변환한다."""
+    year, semester = term.split('-')
+    return f"{year}학년도 {semester}학기"
+
+terms = discover_terms(CATALOG_DIR)
+if not terms:
+    st.error("시간표 엑셀 파일을 찾을 수 없습니다. `app.py`와 같은 폴더에 '경상국립대학교 2025학년도 2학기 시간표.xlsx' 형식의 파일을 넣어주세요.")
+    st.stop()
+
+# URL의 term 파라미터로 학기를 선택한다.
+# term 없이 과목만 있는 예전 공유 링크는 LEGACY_TERM으로, 그 외에는 최신 학기를 사용한다.
+requested_term = st.query_params.get("term")
+if requested_term in terms:
+    current_term = requested_term
+elif requested_term is None and "courses" in st.query_params and LEGACY_TERM in terms:
+    current_term = LEGACY_TERM
+else:
+    current_term = next(iter(terms))
+    if requested_term is not None or "courses" in st.query_params:
+        # 공유 링크의 학기를 찾을 수 없으면 다른 학기의 과목으로 해석될 수 있으므로 알려준다.
+        st.session_state.term_notice = f"공유된 링크의 학기({requested_term or '미지정'})를 찾을 수 없어 {format_term(current_term)} 시간표로 열었습니다. 과목이 다르게 표시될 수 있습니다."
+st.query_params["term"] = current_term  # 공유 링크에 항상 학기가 포함되도록 한다.
+excel_file_path = terms[current_term]
+
+st.title(f"👨‍💻 경상국립대학교 {format_term(current_term)} 시간표 도우미")
+# 안내는 한 번만 보여준다. (공유 과목을 불러오며 rerun하는 경우에만 다음 실행으로 넘겨준다)
+term_notice = st.session_state.pop('term_notice', None)
+if term_notice:
+    st.warning(term_notice)
+
+if len(terms) > 1:
+    chosen_term = st.selectbox("📅 학기 선택", list(terms), index=list(terms).index(current_term), format_func=format_term)
+    if chosen_term != current_term:
+        # 학기가 바뀌면 이전 학기의 과목 파라미터는 의미가 없으므로 함께 초기화한다.
+        st.query_params.clear()
+        st.query_params["term"] = chosen_term
+        st.rerun()
 
 # README 내용을 앱 UI에 통합
-st.markdown("""
-📂 **[2025학년도 2학기 시간표 엑셀 파일 다운로드](https://github.com/youngchaurachacha/gnu-timetable/raw/refs/heads/main/%EA%B2%BD%EC%83%81%EA%B5%AD%EB%A6%BD%EB%8C%80%ED%95%99%EA%B5%90%202025%ED%95%99%EB%85%84%EB%8F%84%202%ED%95%99%EA%B8%B0%20%EC%8B%9C%EA%B0%84%ED%91%9C.xlsx)**
+st.markdown(f"""
+📂 **[{format_term(current_term)} 시간표 엑셀 파일 다운로드]({REPO_RAW_URL}{quote(os.path.basename(excel_file_path))})**
 """)
 
 with st.expander("✨ 주요 기능 및 사용 안내 (클릭하여 확인)"):
@@ -27,9 +90,14 @@ with st.expander("✨ 주요 기능 및 사용 안내 (클릭하여 확인)"):
 
         * **URL을 통한 실시간 공유 (🔗 핵심 기능)**
             * 시간표를 완성하면 현재 상태가 **URL에 실시간으로 반영**됩니다. 이 주소를 복사해서 친구에게 보내면, 친구는 내가 만든 시간표를 그대로 볼 수 있습니다.
+            * 공유 URL에는 학기 정보(`term=2025-2`)가 함께 담겨, 여러 학기의 시간표를 나란히 비교할 수 있습니다.
+
+        * **여러 학기 지원**
+            * `app.py`와 같은 폴더에 `경상국립대학교 2026학년도 1학기 시간표.xlsx`처럼 학기 이름이 들어간 엑셀 파일을 추가하면 자동으로 학기 목록에 등록됩니다. 각 학기 데이터는 처음 선택할 때 불러오며, 최근 사용한 몇 개 학기만 메모리에 유지합니다.
 
         * **이미지 저장 및 편의 기능**
             * **이미지 저장**: 완성된 시간표를 깔끔한 `.png` 파일로 다운로드하여 저장하거나 공유할 수 있습니다.
+            * **캘린더 저장**: 선택한 과목을 학기 동안 매주 반복되는 일정(`.ics`)으로 내보내 휴대폰·구글 캘린더에 바로 가져올 수 있습니다. 여러 시간표를 한 번에 ICS/CSV로 내보낼 수도 있습니다.
             * **학점 계산**: 선택한 과목들의 총 학점이 실시간으로 자동 계산됩니다.
             * **상세 정보**: 이수구분, 수업/원격 방식, 캠퍼스, 강의실 등 수강에 필요한 모든 정보를 한눈에 제공합니다.
         """
@@ -53,21 +121,140 @@ PREDEFINED_COLORS = [
     "#aec7e8", "#ffbb78", "#98df8a", "#ff9896", "#c5b0d5", "#c49c94"
 ]
 
+# --- 교시-시각 변환표 ---
+# 교시 번호 -> (시작, 종료) 시각. 시각은 자정부터 센 분(minute) 단위이다.
+# 기본값: n교시 = (8+n):00 ~ (8+n):50 (0교시 08:00, 1교시 09:00, ...)
+DEFAULT_PERIOD_CLOCK = {p: ((8 + p) * 60, (8 + p) * 60 + 50) for p in range(0, 16)}
+# 캠퍼스별로 교시 시각이 다르면 '캠퍼스구분' 값을 key로 여기에 등록한다. 등록되지 않은 캠퍼스는 기본값을 사용한다.
+CAMPUS_PERIOD_CLOCKS = {}
+
+DAYS_ORDER = ['월', '화', '수', '목', '금', '토', '일']
+# 시간 충돌 검사 해상도(분). 요일별 24시간을 이 단위의 칸으로 나누어 하나의 정수 비트마스크로 표현한다.
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# 교시 표기 외에 '3A'/'3B'(교시 전/후반), '3.5'(=3B), '10:30-11:45'(명시적 시각)도 인식한다.
+TIME_TOKEN_PATTERN = re.compile(r'(\d{1,2}):(\d{2})\s*[-~]\s*(\d{1,2}):(\d{2})|(\d+)(?:\.(5)|([AB]))?')
+
+def get_period_clock(campus):
+    """캠퍼스에 해당하는 교시-시각 변환표를 반환한다."""
+    return CAMPUS_PERIOD_CLOCKS.get(campus, DEFAULT_PERIOD_CLOCK)
+
+def get_period_interval(period_clock, period):
+    """
+    교시의 (시작, 종료) 시각을 반환한다. 캠퍼스 변환표에 없는 교시는 기본 변환표를 따르고,
+    기본 변환표에도 없는 교시(시간표 범위 밖)는 시각을 추정하지 않고 None을 반환한다.
+    """
+    return period_clock.get(period, DEFAULT_PERIOD_CLOCK.get(period))
+
+def format_clock(minutes):
+    """자정부터 센 분을 'HH:MM' 문자열로 변환한다."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def merge_intervals(intervals, max_gap=0):
+    """(시작, 종료) 구간들을 정렬하고, 겹치거나 max_gap분 이내로 떨어진 구간을 하나로 합친다."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + max_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def intervals_to_mask(day, intervals):
+    """한 요일의 (시작, 종료) 구간들을 SLOT_MINUTES 단위 비트마스크로 변환한다."""
+    mask = 0
+    day_offset = DAYS_ORDER.index(day) * SLOTS_PER_DAY
+    for start, end in intervals:
+        first_slot = start // SLOT_MINUTES
+        last_slot = -(-end // SLOT_MINUTES)  # 올림: 칸의 일부만 걸쳐도 사용 중으로 본다.
+        mask |= ((1 << (last_slot - first_slot)) - 1) << (day_offset + first_slot)
+    return mask
+
+def get_meeting_intervals(time_info, period_clock):
+    """
+    parse_time이 기록한 교시 표기(period_parts)를 주어진 변환표로 (시작, 종료) 분 구간으로 바꾼다.
+    'A'/'B'는 교시의 전반/후반만 차지하며, 명시적 시각(clock_intervals)은 변환표와 관계없이 그대로 쓴다.
+    """
+    intervals = list(time_info['clock_intervals'])
+    for period, half in time_info['period_parts']:
+        interval = get_period_interval(period_clock, period)
+        if interval is None: continue
+        start, end = interval
+        middle = start + (end - start) // 2
+        if half == 'A':
+            intervals.append((start, middle))
+        elif half == 'B':
+            intervals.append((middle, end))
+        else:
+            intervals.append((start, end))
+    return merge_intervals(intervals)
+
+def parse_time(time_str, campus, rejected_tokens=None):
+    """
+    '월1,2[강의실],수3A[강의실]' 형식의 문자열을 요일별 {'day', 'periods', 'room', 'intervals'} 목록으로 변환한다.
+    - periods: 시간표 격자에 표시할 교시 번호 (정수)
+    - intervals: 실제 수업 시각 (시작, 종료) 분 단위 구간. 캠퍼스별 교시-시각 변환표를 따른다.
+    - period_parts / clock_intervals: 원래 표기((교시, 'A'/'B'/'')와 명시적 시각). 다른 변환표로 시각을 다시 계산할 때 쓴다.
+    변환표에 없는 교시나 0~24시를 벗어난 시각은 버리고, rejected_tokens 리스트가 주어지면 (원문, 토큰)을 기록한다.
+    """
+    if not isinstance(time_str, str): return []
+    period_clock = get_period_clock(campus)
+    parsed = []
+    # 강의실 이름에도 요일 글자가 들어갈 수 있으므로('023-수질실험실') 요일은 대괄호 밖에서만 찾는다.
+    pattern = r'([월화수목금토일])((?:[^월화수목금토일\[]|\[[^\]]*\])*)'
+    matches = re.finditer(pattern, time_str)
+    for match in matches:
+        day, details = match.group(1), match.group(2)
+        room_match = re.search(r'\[(.*?)\]', details)
+        room = room_match.group(1) if room_match else ''
+        periods, period_parts, clock_intervals = set(), [], []
+        for token in TIME_TOKEN_PATTERN.finditer(re.sub(r'\[.*?\]', '', details)):
+            if token.group(1):  # 명시적 시각: 걸쳐 있는 교시를 모두 격자에 표시한다.
+                start = int(token.group(1)) * 60 + int(token.group(2))
+                end = int(token.group(3)) * 60 + int(token.group(4))
+                if not 0 <= start < end <= 24 * 60 or int(token.group(2)) >= 60 or int(token.group(4)) >= 60:
+                    if rejected_tokens is not None: rejected_tokens.append((time_str, token.group(0)))
+                    continue
+                clock_intervals.append((start, end))
+                periods.update(p for p, (p_start, p_end) in period_clock.items() if p_start < end and start < p_end)
+                continue
+            period = int(token.group(5))
+            if get_period_interval(period_clock, period) is None:
+                if rejected_tokens is not None: rejected_tokens.append((time_str, token.group(0)))
+                continue
+            periods.add(period)
+            period_parts.append((period, 'B' if token.group(6) else (token.group(7) or '')))
+        # 교시 격자에 걸치지 않는 명시적 시각(이른 아침·심야 수업)도 충돌 검사와 캘린더에는 포함한다.
+        if periods or clock_intervals:
+            time_info = {'day': day, 'periods': sorted(periods), 'room': room,
+                         'period_parts': period_parts, 'clock_intervals': clock_intervals}
+            time_info['intervals'] = get_meeting_intervals(time_info, period_clock)
+            parsed.append(time_info)
+    return parsed
+
 def ensure_columns(df, required_cols):
     """데이터프레임에 필요한 컬럼이 없으면 빈 문자열로 추가합니다."""
     for col in required_cols:
         if col not in df.columns:
             df[col] = ''
 
-@st.cache_data
-def load_and_process_data(file_path, major_sheet, general_sheet):
+@st.cache_data(max_entries=MAX_CACHED_TERMS)
+def load_and_process_data(file_path):
     """
     원본 엑셀 파일에서 데이터를 읽고, 수업방식/영역구분 등 모든 정보를 포함하여 처리한다.
-    (최적화) 각 과목의 모든 시간 슬롯을 미리 집합(set)으로 계산하여 'time_slots_set' 컬럼에 저장한다.
+    시트 이름은 학기마다 다르므로 '... 전공 시간표' / '... 교양 시간표'로 끝나는 시트를 찾아 사용한다.
+    (최적화) 각 과목의 수업 시각을 미리 분 단위 비트마스크로 계산하여 'slot_mask' 컬럼에 저장한다.
+    (메모리) 학기는 처음 요청될 때만 읽으며, 최근 사용한 MAX_CACHED_TERMS개 학기만 캐시에 유지한다.
     """
     try:
-        df_major = pd.read_excel(file_path, sheet_name=major_sheet)
-        df_general = pd.read_excel(file_path, sheet_name=general_sheet)
+        excel_file = pd.ExcelFile(file_path)
+        major_sheet = next((name for name in excel_file.sheet_names if name.endswith('전공 시간표')), None)
+        general_sheet = next((name for name in excel_file.sheet_names if name.endswith('교양 시간표')), None)
+        if major_sheet is None or general_sheet is None:
+            st.error(f"'{os.path.basename(file_path)}' 파일에서 전공/교양 시간표 시트를 찾을 수 없습니다.")
+            return None
+        df_major = pd.read_excel(excel_file, sheet_name=major_sheet)
+        df_general = pd.read_excel(excel_file, sheet_name=general_sheet)
     except Exception as e:
         st.error(f"엑셀 파일을 읽는 중 오류 발생: {e}")
         return None
@@ -89,66 +276,97 @@ def load_and_process_data(file_path, major_sheet, general_sheet):
     df_combined['교과목코드'] = df_combined['교과목코드'].astype(int)
     df_combined['분반'] = df_combined['분반'].astype(int)
     
-    def parse_time(time_str):
-        if not isinstance(time_str, str): return []
-        parsed = []
-        pattern = r'([월화수목금토일])([^월화수목금토일]*)'
-        matches = re.finditer(pattern, time_str)
-        for match in matches:
-            day, details = match.group(1), match.group(2)
-            room = (re.search(r'\[(.*?)\]', details).group(1) if re.search(r'\[(.*?)\]', details) else '')
-            periods = sorted([int(p) for p in re.findall(r'\d+', re.sub(r'\[.*?\]', '', details))])
-            if periods: parsed.append({'day': day, 'periods': periods, 'room': room})
-        return parsed
-
-    df_combined['parsed_time'] = df_combined['강의시간/강의실'].apply(parse_time)
+    rejected_tokens = []
+    df_combined['parsed_time'] = [parse_time(time_str, campus, rejected_tokens) for time_str, campus in zip(df_combined['강의시간/강의실'], df_combined['캠퍼스구분'])]
+    if rejected_tokens:
+        examples = ", ".join(f"'{token}' ({time_str})" for time_str, token in rejected_tokens[:3])
+        st.warning(f"강의시간 표기 중 인식할 수 없는 교시·시각 {len(rejected_tokens)}건은 시간표와 충돌 검사에서 제외했습니다. 예: {examples}")
     
-    # 각 과목의 (요일, 교시) 튜플을 set으로 미리 만들어 저장한다.
-    def create_time_slots_set(parsed_time_list):
-        slots = set()
-        if not isinstance(parsed_time_list, list): return slots
+    # 각 과목의 모든 수업 시각을 요일별 SLOT_MINUTES 단위 비트마스크 하나(파이썬 정수)로 미리 만들어 저장한다.
+    def create_slot_mask(parsed_time_list):
+        mask = 0
+        if not isinstance(parsed_time_list, list): return mask
         for time_info in parsed_time_list:
-            for period in time_info['periods']:
-                slots.add((time_info['day'], period))
-        return slots
+            mask |= intervals_to_mask(time_info['day'], time_info['intervals'])
+        return mask
     
     # 이 연산은 앱 로딩 시 한번만 실행된다.
-    df_combined['time_slots_set'] = df_combined['parsed_time'].apply(create_time_slots_set)
+    df_combined['slot_mask'] = df_combined['parsed_time'].apply(create_slot_mask)
+
+    # 교과목코드·시간·교수·수업방법·캠퍼스·비고가 모두 같은 분반은 강의실이나 분반 번호만 다르므로 하나의 그룹으로 묶는다.
+    # (비고에는 수준별 반이나 학과 지정 같은 수강 조건이 적혀 있으므로, 비고가 다르면 다른 그룹으로 둔다.)
+    # 시간 충돌 검사와 과목 목록 표시는 이 그룹 단위로 한 번씩만 수행한다.
+    df_combined['group_id'] = df_combined.groupby(['type', '교과목코드', 'slot_mask', '교수명', '수업방법', '캠퍼스구분', '비고'], sort=False, dropna=False).ngroup()
+    # 그룹 번호는 처음 등장한 순서대로 매겨지므로, 각 그룹의 첫 분반만 모으면 group_id 순서의 대표 행 목록이 된다.
+    df_combined['is_group_representative'] = ~df_combined['group_id'].duplicated()
     
     return df_combined
 
-def get_available_courses(df, selected_codes):
+def get_selected_courses_df(df, selected_ids):
+    """선택된 과목의 행 ID(데이터프레임 index) 목록으로 해당 과목들을 선택 순서대로 반환한다."""
+    return df.loc[list(selected_ids)]
+
+def get_available_courses(df, selected_ids):
     """
     (최적화된 버전) 선택된 과목 리스트를 기반으로 수강 가능한 과목 목록을 필터링한다.
     1. 동일 교과목코드 과목을 먼저 제외한다.
-    2. 선택된 과목들의 모든 시간 슬롯을 하나의 큰 집합(my_busy_slots)으로 만든다.
-    3. 전체 과목을 순회하며 각 과목의 시간 집합이 my_busy_slots과 겹치는지(isdisjoint) 확인한다.
+    2. 선택된 과목들의 비트마스크를 OR 하여 하나의 '바쁜 시간' 마스크(my_busy_mask)로 만든다.
+    3. 분반 그룹별 대표 마스크와 my_busy_mask를 한 번에 AND 하여 겹치는 칸이 없는 그룹의 분반만 남긴다.
     """
-    if not selected_codes:
+    if not selected_ids:
         return df
 
+    my_courses_df = get_selected_courses_df(df, selected_ids)
+
     # 1. 이미 선택한 '교과목코드'가 같은 과목들은 목록에서 제외
-    my_course_codes = {code for code, no in selected_codes}
-    available_df = df[~df['교과목코드'].isin(my_course_codes)]
+    available_df = df[~df['교과목코드'].isin(my_courses_df['교과목코드'])]
 
-    # 2. 내가 선택한 과목들이 차지하는 모든 시간 슬롯을 하나의 집합으로 통합
-    my_courses_df = df[df.set_index(['교과목코드', '분반']).index.isin(selected_codes)]
-    my_busy_slots = set().union(*my_courses_df['time_slots_set'])
+    # 2. 내가 선택한 과목들이 차지하는 모든 시간을 하나의 마스크로 통합
+    my_busy_mask = 0
+    for course_mask in my_courses_df['slot_mask']:
+        my_busy_mask |= course_mask
     
     # 선택한 과목 중에 시간이 지정된 과목이 없으면 시간 필터링 불필요
-    if not my_busy_slots:
+    if not my_busy_mask:
         return available_df
 
     # 3. 남은 과목들 중, 나의 '바쁜 시간'과 겹치지 않는 과목만 최종 선택
-    #    set.isdisjoint()는 두 집합이 겹치지 않으면 True를 반환. list 순회보다 훨씬 빠르다.
-    is_available_time = available_df['time_slots_set'].apply(lambda course_slots: course_slots.isdisjoint(my_busy_slots))
+    #    5분 단위로 1분이라도 겹치면 같은 칸의 비트가 켜지므로, AND 결과가 0이면 충돌이 없다.
+    #    같은 그룹의 분반은 시간이 같으므로 그룹마다 한 번만 검사한다.
+    group_masks = df.loc[df['is_group_representative'], 'slot_mask'].to_numpy()
+    is_available_group = np.bitwise_and(group_masks, my_busy_mask) == 0
     
-    return available_df[is_available_time]
+    return available_df[is_available_group[available_df['group_id'].to_numpy()]]
 
-def format_course_string(x, mode='selectbox'):
+def filter_by_free_time(df, selected_days, selected_periods):
+    """
+    빈 시간 검색: 과목의 모든 수업 시각이 선택한 요일·교시 안에 들어가는 과목만 남긴다.
+    연속해서 선택한 교시 사이의 쉬는 시간도 허용 범위에 포함하며, 시간이 지정되지 않은 과목은 제외한다.
+    """
+    campuses = df['캠퍼스구분'].fillna('')
+    allowed_masks = {}
+    for campus in campuses.unique():
+        period_clock = get_period_clock(campus)
+        allowed_intervals = []
+        for period in sorted(selected_periods):
+            interval = get_period_interval(period_clock, period)
+            if interval is None: continue
+            start, end = interval
+            if allowed_intervals and period - 1 in selected_periods:
+                allowed_intervals[-1] = (allowed_intervals[-1][0], end)
+            else:
+                allowed_intervals.append((start, end))
+        allowed_masks[campus] = 0
+        for day in selected_days:
+            allowed_masks[campus] |= intervals_to_mask(day, allowed_intervals)
+
+    is_within_allowed = [mask != 0 and mask & ~allowed_masks[campus] == 0 for mask, campus in zip(df['slot_mask'], campuses)]
+    return df[is_within_allowed]
+
+def format_course_string(x, mode='selectbox', section_count=1):
     """
     (통합 버전) 과목의 시리즈(행)를 받아 UI에 표시할 문자열을 생성한다.
-    - mode='selectbox': 드롭다운 메뉴용 전체 정보 표시
+    - mode='selectbox': 드롭다운 메뉴용 전체 정보 표시 (section_count > 1이면 묶인 분반 수를 함께 표시)
     - mode='list': 선택된 과목 목록용 축약 정보 표시
     """
     # 공통 정보 구성
@@ -174,9 +392,9 @@ def format_course_string(x, mode='selectbox'):
     
     # mode에 따른 정보 분기
     if mode == 'selectbox':
-        formatted_bunban = f"{int(x['분반']):03d}"
+        formatted_bunban = f"{int(x['분반']):03d}반" if section_count == 1 else f"{int(x['분반']):03d}반 외 {section_count - 1}개 분반"
         formatted_hakjeom = f"{int(x['학점'])}학점" if x['학점'] == int(x['학점']) else f"{x['학점']}학점"
-        professor_info = f"{x['교수명']}, {formatted_bunban}반, {formatted_hakjeom}"
+        professor_info = f"{x['교수명']}, {formatted_bunban}, {formatted_hakjeom}"
     else: # mode == 'list'
         professor_info = x['교수명']
 
@@ -189,65 +407,272 @@ def format_course_string(x, mode='selectbox'):
         
     return base_str
 
-def add_course_to_timetable(course_row):
-    """선택된 과목(row)을 세션에 추가하고, 색상을 할당한 뒤 앱을 새로고침한다."""
-    code, no = course_row['교과목코드'], course_row['분반']
-    
-    if (code, no) in st.session_state.my_courses:
-        st.warning(f"'{course_row['교과목명']}' 과목은 이미 목록에 있습니다.")
+def next_color_index(my_courses):
+    """현재 시간표에서 쓰이지 않는 가장 앞 순서의 색상 번호를 반환한다."""
+    used_color_indices = set(my_courses.values())
+    for color_index in range(len(PREDEFINED_COLORS)):
+        if color_index not in used_color_indices:
+            return color_index
+    return len(my_courses) % len(PREDEFINED_COLORS)
+
+def update_courses_query_param(df, my_courses):
+    """
+    선택한 과목을 '교과목코드-분반' 형식으로 URL에 반영한다.
+    세션에는 행 ID만 저장하지만, 공유 링크는 데이터 파일이 갱신되어도 유효하도록 교과목코드-분반을 사용한다.
+    """
+    if my_courses:
+        my_courses_df = get_selected_courses_df(df, my_courses)
+        st.query_params["courses"] = ",".join(f"{c}-{n}" for c, n in zip(my_courses_df['교과목코드'], my_courses_df['분반']))
+    elif "courses" in st.query_params:
+        del st.query_params["courses"]
+
+def parse_courses_param(df, courses_str):
+    """
+    공유 URL의 '교과목코드-분반,...' 문자열을 {행 ID: 색상 번호}로 변환한다.
+    데이터에 없는 과목은 건너뛰며, 형식이 잘못되면 ValueError가 발생한다.
+    """
+    courses = {}
+    for item in courses_str.split(','):
+        if '-' in item:
+            code, no = map(int, item.split('-'))
+            # df에 해당 과목이 있는지 확인하고, 있으면 행 ID로 저장
+            matched_ids = df.index[(df['교과목코드'] == code) & (df['분반'] == no)]
+            if len(matched_ids) > 0 and int(matched_ids[0]) not in courses:
+                courses[int(matched_ids[0])] = next_color_index(courses)
+    return courses
+
+def parse_bulk_export_lines(bulk_text, current_term, available_terms):
+    """
+    일괄 내보내기 입력을 줄마다 (줄 번호, 학기, '교과목코드-분반,...' 문자열)로 나눈다. 데이터는 읽지 않는다.
+    URL이면 courses/term 파라미터를, 아니면 줄 전체를 현재 학기의 과목 목록으로 본다.
+    찾을 수 없는 학기나 형식이 잘못된 줄은 건너뛰고, 건너뛴 이유를 두 번째 반환값으로 돌려준다.
+    """
+    entries, skipped = [], []
+    for line_no, line in enumerate(bulk_text.splitlines(), start=1):
+        courses_match = re.search(r'courses=([^&\s]+)', line)
+        term_match = re.search(r'term=([^&\s]+)', line)
+        courses_str = unquote(courses_match.group(1)) if courses_match else line.strip()
+        if not courses_str:
+            continue
+        if term_match:
+            line_term = unquote(term_match.group(1))
+        else:
+            # term이 없는 공유 URL은 term 파라미터 도입 이전의 링크이다.
+            line_term = LEGACY_TERM if courses_match else current_term
+        if line_term not in available_terms:
+            skipped.append(f"{line_no}번째 줄의 학기({line_term})를 찾을 수 없어 건너뜁니다.")
+            continue
+        if not re.fullmatch(r'\s*\d+\s*-\s*\d+\s*(,\s*\d+\s*-\s*\d+\s*)*,?', courses_str):
+            skipped.append(f"{line_no}번째 줄의 형식이 올바르지 않아 건너뜁니다.")
+            continue
+        entries.append((line_no, line_term, courses_str))
+    return entries, skipped
+
+def add_course_to_timetable(df, row_id):
+    """선택된 과목(행 ID)을 세션에 추가하고, 색상 번호를 할당한 뒤 앱을 새로고침한다."""
+    row_id = int(row_id)  # numpy 정수 대신 파이썬 int로 저장해 세션 크기를 줄인다.
+    course_name = df.at[row_id, '교과목명']
+
+    if row_id in st.session_state.my_courses:
+        st.warning(f"'{course_name}' 과목은 이미 목록에 있습니다.")
         return
 
-    st.session_state.my_courses.append((code, no))
-    
-    if course_row['교과목명'] not in st.session_state.color_map:
-        next_color_index = len(st.session_state.color_map) % len(PREDEFINED_COLORS)
-        st.session_state.color_map[course_row['교과목명']] = PREDEFINED_COLORS[next_color_index]
-    
-    updated_courses_param = ",".join([f"{c}-{n}" for c, n in st.session_state.my_courses])
-    st.query_params["courses"] = updated_courses_param
+    # my_courses: {행 ID: 색상 번호} (dict는 추가한 순서를 유지한다)
+    st.session_state.my_courses[row_id] = next_color_index(st.session_state.my_courses)
+    update_courses_query_param(df, st.session_state.my_courses)
 
-    st.success(f"✅ '{course_row['교과목명']}' 과목을 추가했습니다.")
+    st.success(f"✅ '{course_name}' 과목을 추가했습니다.")
     st.rerun()
 
-# --- 웹앱 UI 및 로직 ---
-excel_file_path = '경상국립대학교 2025학년도 2학기 시간표.xlsx'
-if not os.path.exists(excel_file_path):
-    st.error(f"'{excel_file_path}' 파일을 찾을 수 없습니다. `app.py`와 같은 폴더에 엑셀 파일을 넣어주세요.")
-    st.stop()
+def collapse_section_groups(df):
+    """
+    필터링·정렬된 과목 목록에서 같은 그룹의 분반을 하나로 묶는다.
+    그룹별 첫 분반(대표 행)으로 이루어진 데이터프레임과 {group_id: 분반 행 ID 목록}을 반환한다.
+    """
+    sections_by_group = {group_id: list(row_ids) for group_id, row_ids in df.groupby('group_id', sort=False).groups.items()}
+    return df.drop_duplicates('group_id'), sections_by_group
+
+def select_section_in_group(sections_df, widget_key):
+    """
+    묶인 분반이 여러 개면 접을 수 있는 목록에서 분반을 고르게 하고, 선택된 분반의 행 ID를 반환한다.
+    (기본값은 첫 번째 분반이며, 분반이 하나뿐이면 그대로 반환한다)
+    """
+    if len(sections_df) == 1:
+        return sections_df.index[0]
+
+    reset_stale_widget_state(widget_key, tuple(sections_df.index))
+    with st.expander(f"🔽 같은 시간·교수·캠퍼스·비고의 분반 {len(sections_df)}개 (강의실 확인 및 분반 선택)"):
+        return st.radio(
+            "분반 선택",
+            options=sections_df.index,
+            format_func=lambda idx: f"{int(sections_df.at[idx, '분반']):03d}반 / {sections_df.at[idx, '캠퍼스구분']} / {sections_df.at[idx, '강의시간/강의실']}",
+            key=widget_key,
+            label_visibility="collapsed"
+        )
+
+def reset_stale_widget_state(widget_key, filter_state):
+    """
+    필터 조건이 바뀌면 이전 조건에서 선택했던 위젯 값을 지운다.
+    위젯 key에 필터 값을 넣으면 조건마다 새 상태가 세션에 계속 쌓이므로, 고정 key를 쓰고 직접 정리한다.
+    """
+    filter_state_key = f"{widget_key}_filters"
+    if st.session_state.get(filter_state_key) != filter_state:
+        st.session_state[filter_state_key] = filter_state
+        st.session_state.pop(widget_key, None)
+
+def estimate_session_bytes(obj, _seen=None):
+    """세션 상태가 차지하는 메모리를 (중첩된 컨테이너까지 포함해) 바이트 단위로 대략 계산한다."""
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_session_bytes(k, _seen) + estimate_session_bytes(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_session_bytes(item, _seen) for item in obj)
+    return size
+
+# --- 캘린더(ICS) / CSV 내보내기 ---
+ICS_TIMEZONE = "Asia/Seoul"
+# 연속된 교시 사이의 쉬는 시간(분). 이 이내로 떨어진 수업은 캘린더에서 하나의 일정으로 합친다.
+ICS_MERGE_GAP_MINUTES = 10
+EXPORT_CSV_COLUMNS = ['시간표', '교과목코드', '분반', '교과목명', '교수명', '요일', '시작', '종료', '강의실']
+
+def default_term_dates(term):
+    """학기 키로 기본 개강일/종강일을 정한다. (1학기 3월 2일~6월 20일, 2학기 9월 1일~12월 19일)"""
+    year, semester = map(int, term.split('-'))
+    if semester == 1:
+        return date(year, 3, 2), date(year, 6, 20)
+    return date(year, 9, 1), date(year, 12, 19)
+
+def iter_course_meetings(courses_df, period_clock=None):
+    """
+    선택한 과목들의 'parsed_time'을 (과목 행, 요일, 시작 분, 종료 분, 강의실) 단위 수업으로 펼친다.
+    period_clock을 주면 교시 표기(전/후반 포함)를 그 변환표로 다시 계산하고, 없으면 캠퍼스별 변환표로 계산된 시각을 쓴다.
+    명시적 시각으로 적힌 수업은 어느 경우든 그 시각을 그대로 쓴다.
+    """
+    for _, course in courses_df.iterrows():
+        for time_info in course['parsed_time']:
+            if period_clock is None:
+                intervals = time_info['intervals']
+            else:
+                intervals = get_meeting_intervals(time_info, period_clock)
+            for start, end in merge_intervals(intervals, max_gap=ICS_MERGE_GAP_MINUTES):
+                yield course, time_info['day'], start, end, time_info['room']
+
+def escape_ics_text(text):
+    """ICS TEXT 값에서 특수문자(\\ ; , 줄바꿈)를 이스케이프한다."""
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def fold_ics_line(line):
+    """RFC 5545에 따라 한 줄을 75바이트 단위로 접는다. (한글이 잘리지 않도록 글자 단위로 자른다)"""
+    chunks, current, current_bytes = [], '', 0
+    for char in line:
+        char_bytes = len(char.encode('utf-8'))
+        if current_bytes + char_bytes > (75 if not chunks else 74):
+            chunks.append(current)
+            current, current_bytes = '', 0
+        current += char
+        current_bytes += char_bytes
+    chunks.append(current)
+    return '\r\n '.join(chunks) + '\r\n'
+
+def iter_ics_lines(courses_df, term_start, term_end, calendar_name, period_clock=None):
+    """
+    선택한 과목들을 학기 기간 동안 매주 반복되는 일정으로 담은 ICS 파일을 한 줄씩 생성한다.
+    각 (요일, 시간, 강의실) 수업이 개강일 이후 첫 해당 요일부터 종강일까지 반복되는 하나의 VEVENT가 된다.
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    # TZID를 쓰는 일정의 UNTIL은 UTC로 적어야 하므로, 종강일 23:59:59(KST)를 UTC로 바꿔 쓴다.
+    until = (datetime.combine(term_end, datetime.max.time()) - timedelta(hours=9)).strftime('%Y%m%dT%H%M%SZ')
+    header = [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//gnu-timetable//KO', 'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape_ics_text(calendar_name)}', f'X-WR-TIMEZONE:{ICS_TIMEZONE}',
+        'BEGIN:VTIMEZONE', f'TZID:{ICS_TIMEZONE}', 'BEGIN:STANDARD', 'DTSTART:19700101T000000',
+        'TZOFFSETFROM:+0900', 'TZOFFSETTO:+0900', 'TZNAME:KST', 'END:STANDARD', 'END:VTIMEZONE',
+    ]
+    for line in header:
+        yield fold_ics_line(line)
+
+    for course, day, start, end, room in iter_course_meetings(courses_df, period_clock):
+        # 개강일 이후 처음 돌아오는 해당 요일이 첫 수업일이다.
+        first_date = term_start + timedelta(days=(DAYS_ORDER.index(day) - term_start.weekday()) % 7)
+        if first_date > term_end:
+            continue
+        first_start = datetime.combine(first_date, datetime.min.time()) + timedelta(minutes=start)
+        first_end = datetime.combine(first_date, datetime.min.time()) + timedelta(minutes=end)
+        code, no = course['교과목코드'], int(course['분반'])
+        event = [
+            'BEGIN:VEVENT',
+            f'UID:{term_start:%Y%m%d}-{code}-{no:03d}-{DAYS_ORDER.index(day)}-{start}@gnu-timetable',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;TZID={ICS_TIMEZONE}:{first_start:%Y%m%dT%H%M%S}',
+            f'DTEND;TZID={ICS_TIMEZONE}:{first_end:%Y%m%dT%H%M%S}',
+            f'RRULE:FREQ=WEEKLY;UNTIL={until}',
+            f"SUMMARY:{escape_ics_text(course['교과목명'])}",
+            f'LOCATION:{escape_ics_text(room)}',
+            'DESCRIPTION:' + escape_ics_text(f"{course['교수명']} / {code}-{no:03d}"),
+            'END:VEVENT',
+        ]
+        for line in event:
+            yield fold_ics_line(line)
+
+    yield fold_ics_line('END:VCALENDAR')
+
+def iter_bulk_export(timetables, export_format, period_clock=None):
+    """
+    여러 시간표를 한 번에 ICS 또는 CSV로 내보낸다.
+    timetables는 (시간표 이름, 선택 과목 데이터프레임, 개강일, 종강일) 튜플의 iterable이며, 시간표마다 학기가 달라도 된다.
+    결과를 한꺼번에 만들지 않고 문자열 조각을 순서대로 yield하므로, 시간표가 많아도 메모리 사용량이 일정하다.
+    - 'ics': 시간표마다 하나의 VCALENDAR를 이어 붙인다.
+    - 'csv': 모든 시간표의 수업을 EXPORT_CSV_COLUMNS 형식의 한 표로 출력한다. (개강일/종강일은 쓰지 않는다)
+    """
+    if export_format == 'ics':
+        for name, courses_df, term_start, term_end in timetables:
+            yield from iter_ics_lines(courses_df, term_start, term_end, name, period_clock)
+        return
 
-master_df = load_and_process_data(excel_file_path, '2학기 전공 시간표', '2학기 교양 시간표')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush_row(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield flush_row(EXPORT_CSV_COLUMNS)
+    for name, courses_df, _, _ in timetables:
+        for course, day, start, end, room in iter_course_meetings(courses_df, period_clock):
+            yield flush_row([name, course['교과목코드'], f"{int(course['분반']):03d}", course['교과목명'], course['교수명'],
+                             day, format_clock(start), format_clock(end), room])
+
+# --- 웹앱 UI 및 로직 ---
+master_df = load_and_process_data(excel_file_path)
 
 if master_df is not None:
-    if 'my_courses' not in st.session_state: st.session_state.my_courses = []
-    if 'color_map' not in st.session_state: st.session_state.color_map = {}
+    # 선택한 과목은 학기별로 의미가 다르므로, 학기가 바뀌면 세션 상태를 새로 시작한다.
+    if st.session_state.get('term') != current_term:
+        st.session_state.term = current_term
+        st.session_state.my_courses = {}
 
     # --- URL 읽기 기능 추가: 앱 로드 시 파라미터 확인 ---
     if "courses" in st.query_params and not st.session_state.my_courses:
         try:
             courses_str = st.query_params.get("courses")
             if courses_str:
-                shared_courses = []
-                items = courses_str.split(',')
-                for item in items:
-                    if '-' in item:
-                        code, no = map(int, item.split('-'))
-                        # master_df에 해당 과목이 있는지 확인
-                        if not master_df[(master_df['교과목코드'] == code) & (master_df['분반'] == no)].empty:
-                            shared_courses.append((code, no))
-                
+                shared_courses = parse_courses_param(master_df, courses_str)
                 if shared_courses:
                     st.session_state.my_courses = shared_courses
-                    # 색상 맵 다시 채우기
-                    shared_courses_df = master_df[master_df.set_index(['교과목코드', '분반']).index.isin(shared_courses)]
-                    for _, course_row in shared_courses_df.iterrows():
-                        if course_row['교과목명'] not in st.session_state.color_map:
-                            next_color_index = len(st.session_state.color_map) % len(PREDEFINED_COLORS)
-                            st.session_state.color_map[course_row['교과목명']] = PREDEFINED_COLORS[next_color_index]
+                    if term_notice:
+                        st.session_state.term_notice = term_notice  # rerun 후에도 학기 안내를 한 번 더 보여준다.
                     # URL을 읽어들인 후에는 rerun하여 정상 상태로 전환
                     st.rerun()
         except (ValueError, IndexError):
             st.error("공유된 URL의 형식이 올바르지 않습니다.")
-            st.query_params.clear() # 잘못된 파라미터는 지워준다.
+            del st.query_params["courses"] # 잘못된 파라미터는 지워준다. (학기 파라미터는 유지)
 
     available_df = get_available_courses(master_df, st.session_state.my_courses)
 
@@ -324,20 +749,8 @@ if master_df is not None:
 
         # 빈 시간 필터 로직
         if selected_days and selected_periods:
-            # 사용자가 선택한 (요일, 교시) 조합으로 '허용된 시간 슬롯' 집합을 생성
-            allowed_slots = set()
-            for day in selected_days:
-                for period in selected_periods:
-                    allowed_slots.add((day, period))
-            
-            # 과목의 모든 시간이 '허용된 시간 슬롯'에 포함되는 경우만 남김
-            # 즉, 과목의 시간 집합이 허용된 시간 집합의 부분집합(subset)이어야 함
-            def is_subset_of_allowed(course_slots):
-                if not course_slots: # 시간이 지정되지 않은 과목은 필터링에서 제외
-                    return False
-                return course_slots.issubset(allowed_slots)
-
-            final_filtered_df = final_filtered_df[final_filtered_df['time_slots_set'].apply(is_subset_of_allowed)]
+            # 과목의 모든 수업 시각이 선택한 (요일, 교시) 범위 안에 포함되는 경우만 남김
+            final_filtered_df = filter_by_free_time(final_filtered_df, selected_days, selected_periods)
 
         # 검색 기능
         search_query = st.text_input("🔎 **과목명 또는 교수명으로 검색**", placeholder="예: 경제학원론 또는 홍길동", key="major_search")
@@ -363,25 +776,30 @@ if master_df is not None:
             if sorted_df.empty:
                 st.warning("선택한 조건에 현재 추가 가능한 전공 과목이 없습니다.")
             else:
-                st.info(f"**{len(sorted_df)}개**의 과목을 찾았습니다.")
+                # 같은 시간·교수·캠퍼스·비고의 분반은 하나의 항목으로 묶어서 보여준다.
+                group_df, sections_by_group = collapse_section_groups(sorted_df)
+                section_info = f" (분반 {len(sorted_df)}개)" if len(sorted_df) != len(group_df) else ""
+                st.info(f"**{len(group_df)}개**의 과목을 찾았습니다.{section_info}")
 
-                # 필터 값에 따라 동적으로 key를 생성
-                filter_state_key = f"{''.join(selected_depts)}-{selected_grade}-{selected_course_type}-{selected_major_campus}-{search_query}"
+                # 필터 값이 바뀌면 이전 선택을 지운다. (key는 고정하여 세션에 위젯 상태가 쌓이지 않도록 한다)
+                filter_state = (tuple(selected_depts), selected_grade, selected_course_type, selected_major_campus,
+                                selected_credit, tuple(selected_days), tuple(selected_periods), search_query)
+                reset_stale_widget_state("major_select", filter_state)
 
                 selected_index = st.selectbox(
                     "추가할 전공 과목 선택",
-                    options=sorted_df.index,
-                    format_func=lambda idx: format_course_string(sorted_df.loc[idx], mode='selectbox'), # 1번 수정사항 적용
-                    key=f"major_select_{filter_state_key}",  # 동적 key 적용
+                    options=group_df.index,
+                    format_func=lambda idx: format_course_string(group_df.loc[idx], mode='selectbox', section_count=len(sections_by_group[group_df.at[idx, 'group_id']])),
+                    key="major_select",
                     placeholder="과목을 선택하세요...",
                     label_visibility="collapsed"
                 )
 
                 if selected_index is not None:
-                    # 버튼의 key도 충돌 방지를 위해 동적으로 변경
-                    if st.button("전공 추가", key=f"add_major_btn_{filter_state_key}", use_container_width=True):
-                        selected_row = sorted_df.loc[selected_index]
-                        add_course_to_timetable(selected_row)
+                    selected_sections = sorted_df.loc[sections_by_group[group_df.at[selected_index, 'group_id']]]
+                    selected_row_id = select_section_in_group(selected_sections, "major_section_select")
+                    if st.button("전공 추가", key="add_major_btn", use_container_width=True):
+                        add_course_to_timetable(master_df, selected_row_id)
 
     with tab_general:
         # 필터링 기반 데이터 정의
@@ -474,14 +892,7 @@ if master_df is not None:
             final_filtered_gen_df = final_filtered_gen_df[final_filtered_gen_df['학점'] == selected_credit]
 
         if selected_days and selected_periods:
-            allowed_slots = set((day, period) for day in selected_days for period in selected_periods)
-            
-            def is_subset_of_allowed(course_slots):
-                if not course_slots:
-                    return False
-                return course_slots.issubset(allowed_slots)
-
-            final_filtered_gen_df = final_filtered_gen_df[final_filtered_gen_df['time_slots_set'].apply(is_subset_of_allowed)]
+            final_filtered_gen_df = filter_by_free_time(final_filtered_gen_df, selected_days, selected_periods)
 
         # 검색 기능
         search_query = st.text_input("🔎 **과목명 또는 교수명으로 검색**", placeholder="예: 문제해결글쓰기 또는 홍길동", key="general_search")
@@ -500,24 +911,30 @@ if master_df is not None:
             # 결과가 있을 때만 정렬 및 나머지 UI를 처리한다.
             sorted_gen_df = final_filtered_gen_df.sort_values(by=['이수구분', '영역구분', '수업방법', '원격강의구분', '교과목명'], ascending=True)
             
-            st.info(f"**{len(sorted_gen_df)}개**의 과목을 찾았습니다.")
+            # 같은 시간·교수·캠퍼스·비고의 분반은 하나의 항목으로 묶어서 보여준다.
+            group_gen_df, sections_by_group_gen = collapse_section_groups(sorted_gen_df)
+            section_info = f" (분반 {len(sorted_gen_df)}개)" if len(sorted_gen_df) != len(group_gen_df) else ""
+            st.info(f"**{len(group_gen_df)}개**의 과목을 찾았습니다.{section_info}")
+
+            # 필터 값이 바뀌면 이전 선택을 지운다. (key는 고정하여 세션에 위젯 상태가 쌓이지 않도록 한다)
+            filter_state = (selected_cat, selected_dream_filter, selected_area, selected_method, selected_remote,
+                            selected_campus, selected_credit, tuple(selected_days), tuple(selected_periods), search_query)
+            reset_stale_widget_state("general_select", filter_state)
 
-            # 필터 값에 따라 동적으로 key를 생성
-            filter_state_key = f"{selected_cat}-{selected_dream_filter}-{selected_area}-{selected_method}-{selected_remote}-{selected_campus}-{search_query}"
-            
             selected_index_gen = st.selectbox(
                 "추가할 교양 과목 선택",
-                options=sorted_gen_df.index,
-                format_func=lambda idx: format_course_string(sorted_gen_df.loc[idx], mode='selectbox'),
-                key=f"general_select_{filter_state_key}",
+                options=group_gen_df.index,
+                format_func=lambda idx: format_course_string(group_gen_df.loc[idx], mode='selectbox', section_count=len(sections_by_group_gen[group_gen_df.at[idx, 'group_id']])),
+                key="general_select",
                 placeholder="과목을 선택하세요...",
                 label_visibility="collapsed"
             )
 
             if selected_index_gen is not None:
-                if st.button("교양 추가", key=f"add_gen_btn_{filter_state_key}", use_container_width=True):
-                    selected_row = sorted_gen_df.loc[selected_index_gen]
-                    add_course_to_timetable(selected_row)
+                selected_sections_gen = sorted_gen_df.loc[sections_by_group_gen[group_gen_df.at[selected_index_gen, 'group_id']]]
+                selected_row_id_gen = select_section_in_group(selected_sections_gen, "general_section_select")
+                if st.button("교양 추가", key="add_gen_btn", use_container_width=True):
+                    add_course_to_timetable(master_df, selected_row_id_gen)
 
     st.divider()
     st.subheader("2. 나의 시간표")
@@ -525,14 +942,13 @@ if master_df is not None:
     if not st.session_state.my_courses:
         st.info("과목을 추가하면 시간표가 여기에 표시됩니다.")
     else:
-        my_courses_df = master_df[master_df.set_index(['교과목코드', '분반']).index.isin(st.session_state.my_courses)]
+        my_courses_df = get_selected_courses_df(master_df, st.session_state.my_courses)
 
-        days_order = ['월', '화', '수', '목', '금', '토', '일']
         days_to_display_set = set(['월', '화', '수', '목', '금'])
         for _, course in my_courses_df.iterrows():
             for time_info in course['parsed_time']:
                 days_to_display_set.add(time_info['day'])
-        days_to_display = [day for day in days_order if day in days_to_display_set]
+        days_to_display = [day for day in DAYS_ORDER if day in days_to_display_set]
 
         default_min_period, default_max_period = 1, 9
         all_periods = [p for _, course in my_courses_df.iterrows() for time_info in course['parsed_time'] for p in time_info['periods']]
@@ -544,11 +960,42 @@ if master_df is not None:
         timetable_data = {}
         for p in range(final_min_period, final_max_period + 1):
             for d in days_to_display:
-                timetable_data[(p, d)] = {"content": "", "color": "white", "span": 1, "is_visible": True}
-
-        for _, course in my_courses_df.iterrows():
+                timetable_data[(p, d)] = {"content": "", "colors": [], "span": 1, "is_visible": True}
+
+        def place_block(day, start_period, block_len, content, color, course_name):
+            """
+            연속된 교시 블록을 시간표 칸에 배치한다. 3A/3B처럼 같은 칸에서 같은 길이로 시작하는 수업은
+            한 칸에 함께 쌓아 표시한다. 그 밖에 이미 차 있는 교시와 겹치면 블록을 합치지 않고,
+            빈 교시에만 따로 표시한 뒤 겹친 교시를 차지한 블록에 경고 표시를 남긴다.
+            """
+            cell = timetable_data.get((start_period, day))
+            if cell and cell["is_visible"] and cell["content"] and cell["span"] == block_len:
+                cell["content"] += '<hr style="margin:2px 0;border:0;border-top:1px solid #999;">' + content
+                cell["colors"].append(color)
+                return
+            run_start = None
+            for p in range(start_period, start_period + block_len + 1):
+                target = timetable_data.get((p, day)) if p < start_period + block_len else None
+                if target is not None and target["is_visible"] and not target["content"]:
+                    if run_start is None: run_start = p
+                    continue
+                if run_start is not None:  # 직전까지 이어진 빈 교시에 블록을 배치한다.
+                    timetable_data[(run_start, day)].update(content=content, colors=[color], span=p - run_start)
+                    for covered in range(run_start + 1, p):
+                        timetable_data[(covered, day)]["is_visible"] = False
+                    run_start = None
+                if target is None: continue
+                anchor = p
+                while not timetable_data[(anchor, day)]["is_visible"]:
+                    anchor -= 1  # 다른 블록에 병합된 칸이면 그 블록의 시작 칸에 경고를 남긴다.
+                anchor_cell = timetable_data[(anchor, day)]
+                warning = f'<div style="color:#c00;font-size:0.85em;">⚠️ {course_name} 시간 겹침</div>'
+                if warning not in anchor_cell["content"]:
+                    anchor_cell["content"] += warning
+
+        for row_id, course in my_courses_df.iterrows():
             if course['parsed_time']:
-                color = st.session_state.color_map.get(course['교과목명'], "white")
+                color = PREDEFINED_COLORS[st.session_state.my_courses[row_id]]
                 for time_info in course['parsed_time']:
                     if time_info['day'] not in days_to_display: continue
                     content = f"<b>{course['교과목명']}</b><br>{course['교수명']}<br>{time_info['room']}"
@@ -559,43 +1006,50 @@ if master_df is not None:
                         if periods[i] == periods[i-1] + 1:
                             block_len += 1
                         else:
-                            if (start_period, time_info['day']) in timetable_data:
-                                timetable_data[(start_period, time_info['day'])].update({"content": content, "color": color, "span": block_len})
-                                for j in range(1, block_len):
-                                    if (start_period + j, time_info['day']) in timetable_data:
-                                        timetable_data[(start_period + j, time_info['day'])]["is_visible"] = False
+                            place_block(time_info['day'], start_period, block_len, content, color, course['교과목명'])
                             start_period, block_len = periods[i], 1
-                    if (start_period, time_info['day']) in timetable_data:
-                        timetable_data[(start_period, time_info['day'])].update({"content": content, "color": color, "span": block_len})
-                        for j in range(1, block_len):
-                            if (start_period + j, time_info['day']) in timetable_data:
-                                timetable_data[(start_period + j, time_info['day'])]["is_visible"] = False
+                    place_block(time_info['day'], start_period, block_len, content, color, course['교과목명'])
 
         day_col_width = (100 - 10) / len(days_to_display)
         
         table_html = f"""<div id="timetable-to-capture"><table class="timetable"><tr><th width="10%">교시</th>"""
         for d in days_to_display: table_html += f'<th width="{day_col_width}%">{d}</th>'
         table_html += '</tr>'
-        time_map = {i: f"{8+i:02d}:00" for i in range(16)}
+        # 선택한 과목이 모두 한 캠퍼스면 그 캠퍼스의 교시-시각 변환표로 시각을 표시한다.
+        my_campuses = set(my_courses_df['캠퍼스구분'].dropna())
+        label_period_clock = get_period_clock(next(iter(my_campuses))) if len(my_campuses) == 1 else DEFAULT_PERIOD_CLOCK
+        time_map = {p: format_clock(get_period_interval(label_period_clock, p)[0]) for p in range(final_min_period, final_max_period + 1)}
         for p in range(final_min_period, final_max_period + 1):
             table_html += f'<tr><td>{p}교시<br>{time_map.get(p, "")}</td>'
             for d in days_to_display:
                 cell = timetable_data.get((p, d))
                 if cell and cell["is_visible"]:
-                    table_html += f'<td rowspan="{cell["span"]}" style="background-color:{cell["color"]};">{cell["content"]}</td>'
+                    # 한 칸에 여러 수업이 쌓이면 과목 색을 위아래로 나누어 칠한다.
+                    colors = cell["colors"] or ["white"]
+                    if len(colors) == 1:
+                        background = colors[0]
+                    else:
+                        stops = ", ".join(f"{c} {i * 100 / len(colors):.0f}% {(i + 1) * 100 / len(colors):.0f}%" for i, c in enumerate(colors))
+                        background = f"linear-gradient(to bottom, {stops})"
+                    table_html += f'<td rowspan="{cell["span"]}" style="background:{background};">{cell["content"]}</td>'
             table_html += '</tr>'
 
-        # 시간 미지정 과목 행 추가
+        # 시간 미지정 과목 행 추가 (교시 격자 밖의 명시적 시각 수업도 시각과 함께 여기에 표시한다)
         untimed_courses = [course for _, course in my_courses_df.iterrows() if not course['parsed_time']]
-        if untimed_courses:
+        off_grid_meetings = [(course, time_info) for _, course in my_courses_df.iterrows() for time_info in course['parsed_time'] if not time_info['periods']]
+        if untimed_courses or off_grid_meetings:
             # 1. '시간 미지정' 레이블이 들어갈 첫 번째 셀 추가
-            table_html += '<tr><td style="font-weight:bold;">시간 미지정</td>'
+            untimed_label = "시간 미지정" if not off_grid_meetings else ("교시 외 시간" if not untimed_courses else "시간 미지정·교시 외")
+            table_html += f'<tr><td style="font-weight:bold;">{untimed_label}</td>'
             
             # 2. 표시할 과목 정보들을 리스트로 만듦
             untimed_content_parts = []
             for course in untimed_courses:
                 professor_info = f"({course['교수명']})"
                 untimed_content_parts.append(f"<b>{course['교과목명']}</b> {professor_info}")
+            for course, time_info in off_grid_meetings:
+                clock_text = ", ".join(f"{format_clock(start)}-{format_clock(end)}" for start, end in time_info['intervals'])
+                untimed_content_parts.append(f"<b>{course['교과목명']}</b> ({course['교수명']}) {time_info['day']} {clock_text} {time_info['room']}")
             
             # 3. 과목들을 <br> 태그로 묶어서 한 줄씩 보이게 함
             untimed_content = "<br>".join(untimed_content_parts)
@@ -606,7 +1060,8 @@ if master_df is not None:
 
         table_html += "</table></div>"
         
-        button_html = """
+        # 저장되는 이미지 파일명에도 학기를 반영한다. (예: 2025-2학기 시간표.png)
+        button_html = f"""<script>const pngFileName = "{current_term}학기 시간표.png";</script>""" + """
         <script src="https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js"></script>
         <button id="download-btn-component" class="download-btn">시간표 이미지로 저장</button>
         <div id="status-message" style="margin-top:10px;font-size:14px"></div>
@@ -624,7 +1079,7 @@ if master_df is not None:
                         // 리사이징 없이, 캡처된 캔버스를 그대로 사용합니다.
                         const link = document.createElement("a");
                         link.href = canvas.toDataURL("image/png");
-                        link.download = "2025-2학기 시간표.png";
+                        link.download = pngFileName;
                         
                         document.body.appendChild(link);
                         link.click();
@@ -664,13 +1119,34 @@ if master_df is not None:
         
         # 3. 시간 미지정 과목이 있으면 추가 높이 계산
         extra_height = 0
-        if untimed_courses:
+        untimed_line_count = len(untimed_courses) + len(off_grid_meetings)
+        if untimed_line_count:
             # 기본 행 높이 55px + 추가 과목당 약 25px (줄바꿈 고려)
-            extra_height = 55 + (len(untimed_courses) - 1) * 25
+            extra_height = 55 + (untimed_line_count - 1) * 25
 
         # 4. 최종 높이로 html 컴포넌트 렌더링
         total_height = base_height + extra_height
         st.components.v1.html(combined_html, height=total_height)
+
+        # 캘린더 내보내기: 학기 기간 동안 매주 반복되는 일정으로 휴대폰/구글 캘린더에 가져올 수 있다.
+        with st.expander("📅 캘린더 파일(.ics)로 저장하기"):
+            default_start, default_end = default_term_dates(current_term)
+            date_cols = st.columns(2)
+            with date_cols[0]:
+                ics_term_start = st.date_input("개강일", value=default_start, key="ics_term_start")
+            with date_cols[1]:
+                ics_term_end = st.date_input("종강일", value=default_end, key="ics_term_end")
+
+            if ics_term_start > ics_term_end:
+                st.warning("종강일은 개강일보다 늦어야 합니다.")
+            else:
+                # 파일 내용은 다운로드 버튼을 눌렀을 때만 만든다. (rerun마다 생성하지 않도록 callable로 전달)
+                ics_calendar_name = f"{format_term(current_term)} 시간표"
+                st.download_button("캘린더 파일 다운로드",
+                                   data=lambda: "".join(iter_ics_lines(my_courses_df, ics_term_start, ics_term_end, ics_calendar_name)),
+                                   file_name=f"{current_term}학기 시간표.ics",
+                                   mime="text/calendar", key="ics_download_btn", use_container_width=True)
+                st.caption("시간 미지정 과목은 캘린더에 포함되지 않습니다. 휴강·보강 등 학사 일정은 반영되지 않으니 참고하세요.")
                         
         st.write("---")
 
@@ -706,10 +1182,8 @@ if master_df is not None:
         with action_col:
             # '전체 초기화' 버튼: 클릭 시 URL 파라미터도 함께 초기화
             if st.button("전체 초기화", type="primary", use_container_width=True):
-                st.session_state.my_courses = []
-                st.session_state.color_map = {}
-                if "courses" in st.query_params:
-                    st.query_params.clear()
+                st.session_state.my_courses = {}
+                update_courses_query_param(master_df, st.session_state.my_courses)
                 st.rerun()
 
         st.info("시간표를 공유하려면 현재 브라우저의 주소창에 있는 전체 URL을 복사하여 전달하세요.", icon="💡")
@@ -726,8 +1200,8 @@ if master_df is not None:
         </style>
         """, unsafe_allow_html=True)
 
-        for index, (code, no) in enumerate(st.session_state.my_courses):
-            course = master_df[(master_df['교과목코드'] == code) & (master_df['분반'] == no)].iloc[0]
+        for row_id, course in my_courses_df.iterrows():
+            code, no = course['교과목코드'], course['분반']
             col1, col2 = st.columns([0.9, 0.1])
             with col1:
                 display_str = format_course_string(course, mode='list') 
@@ -742,16 +1216,62 @@ if master_df is not None:
                 """, unsafe_allow_html=True)
 
             with col2:
-                # 삭제 버튼의 key는 고유해야 하므로 index도 포함
-                if st.button("제거", key=f"del-{code}-{no}-{index}", use_container_width=True, type="secondary"):
-                    st.session_state.my_courses.pop(index)
-                    
-                    # URL 업데이트
-                    updated_courses_param = ",".join([f"{c}-{n}" for c, n in st.session_state.my_courses])
-                    if updated_courses_param:
-                        st.query_params["courses"] = updated_courses_param
-                    else: # 마지막 과목이 제거된 경우
-                        if "courses" in st.query_params:
-                            st.query_params.clear()
-                            
+                # 삭제 버튼의 key는 행 ID로 고정 (선택한 과목 수만큼만 존재)
+                if st.button("제거", key=f"del-{row_id}", use_container_width=True, type="secondary"):
+                    st.session_state.my_courses.pop(row_id)
+                    update_courses_query_param(master_df, st.session_state.my_courses)
                     st.rerun()
+
+    # 여러 시간표 일괄 내보내기: 공유 URL(또는 '교과목코드-분반,...')을 한 줄에 하나씩 붙여넣는다.
+    with st.expander("📦 여러 시간표 한 번에 내보내기 (ICS/CSV)"):
+        bulk_input = st.text_area("공유 URL 목록 (한 줄에 하나)", key="bulk_export_input",
+                                  placeholder="https://gnu-timetable-maker.streamlit.app/?term=2025-2&courses=...")
+        bulk_format = st.radio("형식", ["csv", "ics"], format_func=lambda x: x.upper(), horizontal=True, key="bulk_export_format")
+
+        if bulk_format == 'ics':
+            # 현재 학기 시간표에 쓸 개강일/종강일. 위의 캘린더 저장에서 고친 날짜가 있으면 그대로 이어받는다.
+            default_start, default_end = default_term_dates(current_term)
+            bulk_date_cols = st.columns(2)
+            with bulk_date_cols[0]:
+                bulk_term_start = st.date_input("개강일", value=st.session_state.get("ics_term_start", default_start), key="bulk_term_start")
+            with bulk_date_cols[1]:
+                bulk_term_end = st.date_input("종강일", value=st.session_state.get("ics_term_end", default_end), key="bulk_term_end")
+            st.caption(f"{format_term(current_term)}이 아닌 학기의 링크는 해당 학기의 기본 개강일/종강일을 사용합니다.")
+        else:
+            bulk_term_start, bulk_term_end = default_term_dates(current_term)
+
+        # rerun마다 하는 일은 입력 줄 검사뿐이다. 학기 데이터 읽기와 과목 조회는 다운로드할 때만 한다.
+        bulk_entries, bulk_skipped = parse_bulk_export_lines(bulk_input, current_term, terms)
+        for message in bulk_skipped:
+            st.warning(message)
+
+        def build_bulk_export():
+            """다운로드 버튼을 눌렀을 때 호출된다. 줄에 나온 학기는 학기마다 한 번씩만 읽는다."""
+            term_dfs = {current_term: master_df}
+            timetables = []
+            for line_no, line_term, courses_str in bulk_entries:
+                if line_term not in term_dfs:
+                    term_dfs[line_term] = load_and_process_data(terms[line_term])
+                line_df = term_dfs[line_term]
+                if line_df is None: continue
+                bulk_courses = parse_courses_param(line_df, courses_str)
+                if bulk_courses:
+                    line_start, line_end = (bulk_term_start, bulk_term_end) if line_term == current_term else default_term_dates(line_term)
+                    timetables.append((f"시간표 {line_no} ({format_term(line_term)})", get_selected_courses_df(line_df, bulk_courses), line_start, line_end))
+            # 엑셀에서 한글이 깨지지 않도록 CSV는 BOM 포함
+            return "".join(iter_bulk_export(timetables, bulk_format)).encode('utf-8-sig' if bulk_format == 'csv' else 'utf-8')
+
+        if bulk_format == 'ics' and bulk_term_start > bulk_term_end:
+            st.warning("종강일은 개강일보다 늦어야 합니다.")
+        elif bulk_entries:
+            # 파일 내용은 다운로드 버튼을 눌렀을 때만 만든다. (rerun마다 생성하지 않도록 callable로 전달)
+            st.download_button(f"{len(bulk_entries)}개 시간표 다운로드",
+                               data=build_bulk_export,
+                               file_name=f"{current_term}학기 시간표 모음.{bulk_format}",
+                               mime="text/csv" if bulk_format == 'csv' else "text/calendar",
+                               key="bulk_download_btn", use_container_width=True)
+
+    # ?debug=1 로 접속하면 현재 세션이 차지하는 메모리를 표시한다. (수강신청 기간 메모리 점검용)
+    if st.query_params.get("debug") == "1":
+        session_bytes = estimate_session_bytes({key: st.session_state[key] for key in st.session_state})
+        st.caption(f"세션 상태: {len(st.session_state)}개 항목, 약 {session_bytes:,} bytes")